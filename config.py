@@ -1,12 +1,16 @@
 """Configuration management for Elastic Billing MCP Server."""
+import functools
 import logging
 
 import os
+from dotenv import dotenv_values
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+_ENV_PREFIX_LEN = len(".env.")
+
 
 class Settings(BaseSettings):
     """Application settings."""
@@ -30,14 +34,9 @@ class Settings(BaseSettings):
     def get_account_credentials(self, account: str = default_account) -> tuple[str, str| None]:
         """Get API key and org ID for specified account."""
         
-        if account in available_accounts().get("accounts", []):
+        if account in _account_names():
             try:
-                env_file_path = os.path.join(self.accounts_dir, f".env.{account}")
-                temp_settings = Settings(_env_file=env_file_path)
-                logger.info(
-                    f"Loaded settings from {env_file_path} for account {account}"
-                )
-                return temp_settings.elastic_api_key, temp_settings.elastic_org_id
+                return _load_account_credentials(self.accounts_dir, account)
             except Exception as e:
                 raise ValueError(f"Could not load credentials for account <{account}>, confirm .env file exists. {e!s}") from e
         raise ValueError(f"Account {account} not found in accounts directory.")
@@ -49,19 +48,55 @@ class Settings(BaseSettings):
     )
 
 
+@functools.lru_cache(maxsize=16)
+def _load_account_credentials(accounts_dir: str, account: str) -> tuple[str, str | None]:
+    """Read only the credential keys of an account .env file, cached until reload_accounts is called."""
+    env_file_path = os.path.join(accounts_dir, f".env.{account}")
+    values = dotenv_values(env_file_path)
+    api_key = values.get("ELASTIC_API_KEY")
+    if not api_key:
+        # dotenv_values gives None for a key without "=" and "" for an empty value
+        raise ValueError(f"ELASTIC_API_KEY is missing or empty in {env_file_path}")
+    logger.info("Loaded credentials from %s for account %s", env_file_path, account)
+    return api_key, values.get("ELASTIC_ORG_ID") or None
+
+
+@functools.lru_cache(maxsize=1)
+def _scan_accounts() -> frozenset[str]:
+    """Scan accounts_dir once for .env files, cached until reload_accounts is called."""
+    # DirEntry caches its file type, so skipping directories costs no extra stat call for regular files
+    with os.scandir(settings.accounts_dir) as entries:
+        return frozenset(
+            entry.name[_ENV_PREFIX_LEN:]
+            for entry in entries
+            if entry.name.startswith(".env.") and entry.is_file()
+        )
+
+
+def _account_names() -> frozenset[str]:
+    """Get the cached account names, empty if accounts_dir can not be read."""
+    try:
+        return _scan_accounts()
+    except Exception as e:
+        logger.error("Failed to list accounts: %s", e)
+        return frozenset()
+
+
 def available_accounts() -> dict:
     """List all available accounts based on .env files in accounts_dir directory."""
-    accounts = []
     try:
-        for filename in os.listdir(settings.accounts_dir):
-            if filename.startswith(".env."):
-                account_name = filename[len(".env.") :]
-                accounts.append(account_name)
-        return {"accounts": accounts}
+        return {"accounts": sorted(_scan_accounts())}
     except Exception as e:
-        logger.error(f"Failed to list accounts: {e!s}")
+        logger.error("Failed to list accounts: %s", e)
         return {"error": f"Failed to list accounts: {e!s}"}
 
 
+def reload_accounts() -> dict:
+    """Drop the cached account list and credentials and scan accounts_dir again."""
+    _scan_accounts.cache_clear()
+    _load_account_credentials.cache_clear()
+    return available_accounts()
+
+
 # Global settings instance
 settings = Settings()
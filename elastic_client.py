@@ -1,82 +1,186 @@
 """Elastic Cloud API client for billing and deployment data."""
 
+import asyncio
+import functools
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from typing import Any
 
 import httpx
+import orjson
 from async_lru import alru_cache
 
 from config import settings
 
 logger = logging.getLogger("elastic-cloud-billing-mcp.elastic-client")
 
+_UTC = ZoneInfo("UTC")
+# Response bodies above this size are decoded in a worker thread to keep the event loop responsive
+_THREADED_DECODE_MIN_BYTES = 64 * 1024
+# ETag entries must outlive the 300s alru TTL, otherwise an alru miss never finds one to revalidate with
+_ETAG_CACHE_MAX_ENTRIES = 64
+_ETAG_CACHE_TTL_SECONDS = 3600
+
+
+def _to_utc(dt: datetime) -> datetime:
+    """Convert to UTC, returning aware datetimes that are already UTC unchanged."""
+    if dt.tzinfo is _UTC or (dt.tzinfo is not None and dt.utcoffset() == timedelta(0)):
+        return dt
+    return dt.astimezone(_UTC)
+
+
+def _canonicalize(dt: datetime) -> str:
+    """Convert to a UTC ISO string truncated to the minute.
+
+    Billing queries are sent with minute granularity, so near-identical timestamps
+    (e.g. differing only in seconds/microseconds or timezone offset) share one cache entry.
+    """
+    dt = _to_utc(dt)
+    if dt.second or dt.microsecond:
+        dt = dt.replace(second=0, microsecond=0)
+    return dt.isoformat()
+
 
 class ElasticCloudClient:
     """Client for interacting with Elastic Cloud API."""
 
     def __init__(self, account: str):
         try:
-            logger.info(f"Initializing Elastic Cloud client for account: {account}")
+            logger.info("Initializing Elastic Cloud client for account: %s", account)
             self.account = account  # This is how we identify the account in our settings, not related to API or org IDs
-            self.api_key  = settings.get_account_credentials(account)[0]
-            self.org_id = settings.get_account_credentials(account)[1] or None  # Can be ommited in env
+            self.api_key, org_id = settings.get_account_credentials(account)
+            self.org_id = org_id or None  # Can be ommited in env
             self.base_url = settings.elastic_base_url
             self.billing_base_url = settings.billing_base_url
             self._account_id = None  # Lazy loaded account ID from /api/v1/account, acts as org_id if none provided
+            # Last ETag, decoded body and store time per (url, params), revalidated with If-None-Match
+            self._etags: dict[tuple[str, tuple], tuple[str, Any, float]] = {}
+            # Requests currently running per (url, params), shared by concurrent identical calls
+            self._inflight: dict[tuple[str, tuple], asyncio.Task] = {}
+            # Response caches are per instance (wrapping bound methods), so clearing them never touches other accounts
+            self._cached_billing_request = alru_cache(maxsize=128)(self._cached_billing_request)
+            ttl_cache = alru_cache(maxsize=32, ttl=300)
+            self._get_deployments_cached = ttl_cache(self._get_deployments_cached)
+            self.get_deployment = ttl_cache(self.get_deployment)
+            self.get_organizations = ttl_cache(self.get_organizations)
+            self._get_organization_cached = ttl_cache(self._get_organization_cached)
+            self._get_organization_members_cached = ttl_cache(self._get_organization_members_cached)
 
-            self.headers = {
-                "Authorization": f"ApiKey {self.api_key}",
-                "Content-Type": "application/json",
-            }
+            # Single pooled client reused across requests, avoids a TCP+TLS handshake per call
+            self._client = httpx.AsyncClient(
+                headers={
+                    "Authorization": f"ApiKey {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+                timeout=httpx.Timeout(30.0),
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            )
             logger.info(
-                f"Elastic Cloud client initialized for account: {account}, org: {self.org_id or 'Not Provided'}"
+                "Elastic Cloud client initialized for account: %s, org: %s", account, self.org_id or "Not Provided"
             )
         except Exception as e:
-            logger.error(f"Failed to initialize Elastic Cloud client: {e!s}")
+            logger.error("Failed to initialize Elastic Cloud client: %s", e)
             raise
 
-    def switch_account(self, account: str):
-        """Switch to a different account."""
-        logger.info(f"Switching from {self.account} to {account}")
-        try:
-            self.api_key, self.org_id = settings.get_account_credentials(account)
-            self.account = account
-            self.headers["Authorization"] = f"ApiKey {self.api_key}"
-            self._account_id = None  # Reset cached account ID
-            logger.info(f"Switched to account: {account}, org: {self.org_id or 'Not Provided'}")
-        except Exception as e:
-            logger.error(f"Failed to switch account to {account}: {e!s}")
-            raise ValueError(f"Could not switch to account {account}") from e
-        
+    async def wait_idle(self):
+        """Wait until no requests are in flight on this client."""
+        while self._inflight:
+            # asyncio.wait (unlike gather) does not cancel the shared requests if this waiter is cancelled
+            await asyncio.wait(list(self._inflight.values()))
+
+    async def close(self):
+        """Cancel requests still in flight, then close the underlying HTTP client and its pooled connections."""
+        # In-flight requests are shielded from their callers, so they have to be cancelled here
+        pending = list(self._inflight.values())
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _get(
+        self, base_url: str, endpoint: str, params: dict | None = None, revalidate: bool = True
+    ) -> dict[str, Any]:
+        """Make authenticated GET request to an Elastic Cloud API (base_url selects API or Billing API).
+
+        Concurrent identical requests share a single upstream call.
+        With revalidate the response is stored with its ETag and later requests send If-None-Match.
+        """
+        url = f"{base_url}{endpoint}"
+        request_key = (url, tuple(sorted(params.items())) if params else ())
+        task = self._inflight.get(request_key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(url, request_key, params, revalidate))
+            self._inflight[request_key] = task
+            task.add_done_callback(functools.partial(self._forget_inflight, request_key))
+        # Shield so a cancelled caller does not cancel the request for the other waiters
+        return await asyncio.shield(task)
 
-    async def _make_request(
-        self, endpoint: str, params: dict | None = None
+    def _forget_inflight(self, request_key: tuple, task: asyncio.Task):
+        """Remove a finished request from the in-flight map."""
+        if self._inflight.get(request_key) is task:
+            del self._inflight[request_key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved, waiters (if any) already got it
+
+    async def _fetch(
+        self, url: str, request_key: tuple, params: dict | None = None, revalidate: bool = True
     ) -> dict[str, Any]:
-        """Make authenticated request to Elastic Cloud API."""
-        url = f"{self.base_url}{endpoint}"
-        logger.debug(f"Making API request to: {endpoint}")
+        """Issue the GET request, revalidating with a stored ETag when available.
+
+        On a 304 the stored body is returned as is, i.e. the same dict object as the earlier response.
+        """
+        logger.debug("Making API request to: %s", url)
+
+        cached = self._etags.get(request_key)
+        if cached and time.monotonic() - cached[2] > _ETAG_CACHE_TTL_SECONDS:
+            del self._etags[request_key]
+            cached = None
+        headers = {"If-None-Match": cached[0]} if cached else None
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, params=params)
-                response.raise_for_status()
-                logger.debug(f"API request successful: {response.status_code}")
-                return response.json()
+            response = await self._client.get(url, params=params, headers=headers)
+            if response.status_code == httpx.codes.NOT_MODIFIED and cached:
+                logger.debug("API response not modified, using cached body for: %s", url)
+                # Still valid, refresh its age and move it to the end so it is evicted last
+                del self._etags[request_key]
+                self._etags[request_key] = (cached[0], cached[1], time.monotonic())
+                return cached[1]
+            response.raise_for_status()
+            logger.debug("API request successful: %s", response.status_code)
+
+            body = response.content
+            if len(body) < _THREADED_DECODE_MIN_BYTES:
+                data = orjson.loads(body)
+            else:
+                data = await asyncio.to_thread(orjson.loads, body)
+
+            etag = response.headers.get("etag") if revalidate else None
+            if etag:
+                if len(self._etags) >= _ETAG_CACHE_MAX_ENTRIES and request_key not in self._etags:
+                    del self._etags[next(iter(self._etags))]  # Drop the oldest entry
+                self._etags[request_key] = (etag, data, time.monotonic())
+            return data
         except httpx.HTTPStatusError as e:
             logger.error(
-                f"HTTP error {e.response.status_code} for {endpoint}: {e.response.text}"
+                "HTTP error %s for %s: %s", e.response.status_code, url, e.response.text
             )
             raise
         except httpx.RequestError as e:
-            logger.error(f"Request error for {endpoint}: {e!s}")
+            logger.error("Request error for %s: %s", url, e)
             raise
         except Exception as e:
-            logger.error(f"Unexpected error for {endpoint}: {e!s}")
+            logger.error("Unexpected error for %s: %s", url, e)
             raise
 
-    @alru_cache(maxsize=128)
     async def _cached_billing_request(
         self, 
         endpoint: str, 
@@ -90,38 +194,13 @@ class ElasticCloudClient:
         if enddate_iso:
             params["to"] = enddate_iso
             
-        return await self._make_billing_request(endpoint, params)
-
-    async def _make_billing_request(
-        self, endpoint: str, params: dict | None = None
-    ) -> dict[str, Any]:
-        """Make authenticated request to Elastic Cloud Billing API."""
-        url = f"{self.billing_base_url}{endpoint}"
-        logger.debug(f"Making billing API request to: {endpoint}")
-
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, params=params)
-                response.raise_for_status()
-                logger.debug(f"Billing API request successful: {response.status_code}")
-                return response.json()
-        except httpx.HTTPStatusError as e:
-            logger.error(
-                f"HTTP error {e.response.status_code} for billing {endpoint}: {e.response.text}"
-            )
-            raise
-        except httpx.RequestError as e:
-            logger.error(f"Request error for billing {endpoint}: {e!s}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error for billing {endpoint}: {e!s}")
-            raise
+        # No ETag revalidation, the billing cache has no TTL so a stored body would only duplicate it
+        return await self._get(self.billing_base_url, endpoint, params, revalidate=False)
 
     async def get_deployments(self) -> list[dict[str, Any]]:
         """Get all deployments for the organization."""
         return await self._get_deployments_cached(self.org_id)
 
-    @alru_cache(maxsize=32, ttl=300)
     async def _get_deployments_cached(self, org_id: str | None) -> list[dict[str, Any]]:
         """Get all deployments for the account or filtered with org_id, with caching."""
         endpoint = "/api/v1/deployments"
@@ -129,36 +208,56 @@ class ElasticCloudClient:
             params = None
         else:
             params = {"q": f"organization_id:{org_id}"}
-        return await self._make_request(endpoint, params)
+        return await self._get(self.base_url, endpoint, params)
 
-    @alru_cache(maxsize=32, ttl=300)
     async def get_deployment(self, deployment_id: str) -> dict[str, Any]:
         """Get specific deployment details."""
         endpoint = f"/api/v1/deployments/{deployment_id}"
-        return await self._make_request(endpoint)
+        return await self._get(self.base_url, endpoint)
 
     async def get_account_info(self) -> dict[str, Any]:
         """Get account information."""
         endpoint = f"/api/v1/account"
         if self._account_id is None:
-            result = await self._make_request(endpoint)
+            result = await self._get(self.base_url, endpoint)
             self._account_id = result.get("id") # Cache account ID
         return {"id" : self._account_id }
 
     async def get_organizations(self) -> list[dict[str, Any]]:
         """Get organizations accessible with the current API key."""
         endpoint = "/api/v1/organizations"
-        return await self._make_request(endpoint)
+        return await self._get(self.base_url, endpoint)
 
     async def get_organization(self, org_id: str | None) -> dict[str, Any]:
         """Get specific organization details. If org_id is None, use current account id."""
-        endpoint = f"/api/v1/organizations/{org_id or self._account_id}"
-        return await self._make_request(endpoint)
+        return await self._get_organization_cached(org_id or self._account_id)
+
+    async def _get_organization_cached(self, org_id: str | None) -> dict[str, Any]:
+        """Get specific organization details, with caching."""
+        endpoint = f"/api/v1/organizations/{org_id}"
+        return await self._get(self.base_url, endpoint)
 
     async def get_organization_members(self, org_id: str | None) -> list[dict[str, Any]]:
         """Get members of the current organization."""
-        endpoint = f"/api/v1/organizations/{org_id or self._account_id}/members"
-        return await self._make_request(endpoint)
+        return await self._get_organization_members_cached(org_id or self._account_id)
+
+    async def _get_organization_members_cached(self, org_id: str | None) -> list[dict[str, Any]]:
+        """Get members of an organization, with caching."""
+        endpoint = f"/api/v1/organizations/{org_id}/members"
+        return await self._get(self.base_url, endpoint)
+
+    def invalidate_caches(self):
+        """Clear this client's cached API responses and ETags, to be used after any call that changes remote state."""
+        for cached_method in (
+            self._cached_billing_request,
+            self._get_deployments_cached,
+            self.get_deployment,
+            self.get_organizations,
+            self._get_organization_cached,
+            self._get_organization_members_cached,
+        ):
+            cached_method.cache_clear()
+        self._etags.clear()
 
     # Get billing data methods
     async def get_instances_costs(
@@ -167,12 +266,9 @@ class ElasticCloudClient:
         """Get costs associated with all instances for date range."""
         endpoint = f"/api/v2/billing/organizations/{organization_id}/costs/instances"
 
-        return await self._cached_billing_request(
-            endpoint, 
-            startdate_iso=start_date.astimezone(ZoneInfo("UTC")).isoformat(),
-            enddate_iso=end_date.astimezone(ZoneInfo("UTC")).isoformat(),
-            # org_id=organization_id
-        )
+        startdate_iso = _canonicalize(start_date)
+        enddate_iso = _canonicalize(end_date)
+        return await self._cached_billing_request(endpoint, startdate_iso, enddate_iso)
 
     async def get_instance_costs(
         self, start_date: datetime, end_date: datetime, organization_id: str, instance_id: str
@@ -180,12 +276,9 @@ class ElasticCloudClient:
         """Get costs associated to a set of items billed for a single instance for date range."""
         endpoint = f"/api/v2/billing/organizations/{organization_id}/costs/instances/{instance_id}/items"
 
-        return await self._cached_billing_request(
-            endpoint, 
-            startdate_iso=start_date.astimezone(ZoneInfo("UTC")).isoformat(),
-            enddate_iso=end_date.astimezone(ZoneInfo("UTC")).isoformat(),
-            # org_id=organization_id
-        )
+        startdate_iso = _canonicalize(start_date)
+        enddate_iso = _canonicalize(end_date)
+        return await self._cached_billing_request(endpoint, startdate_iso, enddate_iso)
 
     async def get_items_costs(
         self, start_date: datetime, end_date: datetime, organization_id: str
@@ -193,8 +286,111 @@ class ElasticCloudClient:
         """Get costs for all items for specific organization."""
         endpoint = f"/api/v2/billing/organizations/{organization_id}/costs/items"
 
-        return await self._cached_billing_request(
-            endpoint, 
-            startdate_iso=start_date.astimezone(ZoneInfo("UTC")).isoformat(),
-            enddate_iso=end_date.astimezone(ZoneInfo("UTC")).isoformat(),
-        )
\ No newline at end of file
+        startdate_iso = _canonicalize(start_date)
+        enddate_iso = _canonicalize(end_date)
+        return await self._cached_billing_request(endpoint, startdate_iso, enddate_iso)
+
+    async def get_instance_costs_range(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        organization_id: str,
+        instance_id: str,
+        segment: timedelta = timedelta(days=365),
+    ) -> dict[str, Any]:
+        """Get instance costs for a period longer than the API allows, fetching segments concurrently.
+
+        Segment responses are merged with _merge_costs: numbers are summed, list entries of the same
+        type are combined and fields that differ between segments are dropped.
+        """
+        if start_date >= end_date:
+            raise ValueError(f"start_date {start_date} must be before end_date {end_date}")
+
+        segments = []
+        segment_start = start_date
+        while segment_start < end_date:
+            segment_end = min(segment_start + segment, end_date)
+            segments.append((segment_start, segment_end))
+            segment_start = segment_end
+
+        results = await asyncio.gather(
+            *(
+                self.get_instance_costs(seg_start, seg_end, organization_id, instance_id)
+                for seg_start, seg_end in segments
+            )
+        )
+        return _merge_costs(results)
+
+
+# Marks a field whose values differ between segments and can not be combined, removed from the merged result
+_UNMERGEABLE = object()
+
+
+def _merge_costs(results: list[dict[str, Any]]) -> dict[str, Any]:
+    """Merge per-segment cost responses into one response for the whole period.
+
+    Numbers are summed at any depth, list entries with the same "type" are merged into one entry,
+    other list entries are concatenated and fields whose non-numeric values differ between segments
+    (e.g. periods or formatted values) are dropped. None counts as missing.
+    """
+    merged: dict[str, Any] = {}
+    for result in results:
+        merged = _merge_dicts(merged, result)
+    return _drop_unmergeable(merged)
+
+
+def _merge_values(a: Any, b: Any) -> Any:
+    """Merge two values of the same field from different segments."""
+    if a is _UNMERGEABLE or b is _UNMERGEABLE:
+        return _UNMERGEABLE
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if isinstance(a, dict) and isinstance(b, dict):
+        return _merge_dicts(a, b)
+    if isinstance(a, list) and isinstance(b, list):
+        return _merge_lists(a, b)
+    if _is_number(a) and _is_number(b):
+        return a + b
+    return a if a == b else _UNMERGEABLE
+
+
+def _is_number(value: Any) -> bool:
+    """Check for an int or float that is not a bool."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _merge_dicts(a: dict[str, Any], b: dict[str, Any]) -> dict[str, Any]:
+    """Merge two dicts into a new one, never mutating the (possibly cached) inputs."""
+    merged = dict(a)
+    for key, value in b.items():
+        merged[key] = _merge_values(merged[key], value) if key in merged else value
+    return merged
+
+
+def _merge_lists(a: list[Any], b: list[Any]) -> list[Any]:
+    """Merge two lists, combining dict entries that share a "type" and appending the rest."""
+    merged = list(a)
+    by_type = {}
+    for index, item in enumerate(merged):
+        if isinstance(item, dict) and "type" in item:
+            by_type.setdefault(item["type"], index)
+    for item in b:
+        if isinstance(item, dict) and item.get("type") in by_type:
+            index = by_type[item["type"]]
+            merged[index] = _merge_dicts(merged[index], item)
+        else:
+            if isinstance(item, dict) and "type" in item:
+                by_type[item["type"]] = len(merged)
+            merged.append(item)
+    return merged
+
+
+def _drop_unmergeable(value: Any) -> Any:
+    """Remove fields marked as unmergeable from a merged value."""
+    if isinstance(value, dict):
+        return {k: _drop_unmergeable(v) for k, v in value.items() if v is not _UNMERGEABLE}
+    if isinstance(value, list):
+        return [_drop_unmergeable(v) for v in value if v is not _UNMERGEABLE]
+    return value
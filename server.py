@@ -1,38 +1,110 @@
 """MCP Server for Elastic Cloud Billing Analysis."""
 
+import asyncio
+import atexit
+import contextlib
 import json
 import logging
+import queue
 import sys
+from contextlib import asynccontextmanager
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 
 from fastmcp import FastMCP
+from fastmcp.server.dependencies import get_context
 
-from config import settings, available_accounts
+from config import settings, available_accounts, reload_accounts as reload_account_files
 from elastic_client import ElasticCloudClient
 
 # Configure logging
+# Records are formatted by the QueueHandler and written by a background listener thread,
+# so logging never blocks the event loop on file/stream IO
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(
+    log_queue,
+    logging.FileHandler("elastic_cloud_billing_mcp.log"),
+    logging.StreamHandler(sys.stderr),
+)
+log_listener.start()
+atexit.register(log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("elastic_cloud_billing_mcp.log"),
-        logging.StreamHandler(sys.stderr),
-    ],
+    handlers=[QueueHandler(log_queue)],
 )
 logger = logging.getLogger("elastic-cloud-billing-mcp")
 
+
+async def warm_up_clients(clients: dict[str, ElasticCloudClient]):
+    """Fetch the account id of every client concurrently so it is cached before the first tool call."""
+    results = await asyncio.gather(
+        *(client.get_account_info() for client in clients.values()), return_exceptions=True
+    )
+    for account, result in zip(clients, results):
+        if isinstance(result, Exception):
+            logger.warning("Failed to warm up client for account %s: %s", account, result)
+
+
+async def close_when_idle(client: ElasticCloudClient):
+    """Close a client that is no longer handed out, after its in-flight requests finish."""
+    try:
+        await client.wait_idle()
+    finally:
+        await client.close()
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    """Create clients for all accounts on startup and close them on shutdown."""
+    try:
+        logger.info("Initializing Elastic Billing MCP Server...")
+        # One client per account, switching accounts never mutates a client so caches can't leak across accounts
+        clients = {settings.default_account: ElasticCloudClient(settings.default_account)}
+        logger.info("MCP Server initialized successfully")
+    except Exception as e:
+        logger.exception("Failed to initialize elastic client: %s", e)
+        raise
+
+    # Other accounts are optional, a broken account file should not prevent the server from starting
+    for account in available_accounts().get("accounts", []):
+        if account not in clients:
+            try:
+                clients[account] = ElasticCloudClient(account)
+            except Exception as e:
+                logger.warning("Skipping client for account %s: %s", account, e)
+
+    warm_up = asyncio.create_task(warm_up_clients(dict(clients)))
+    state = {"clients": clients, "active_account": settings.default_account, "closing": set()}
+    try:
+        yield state
+    finally:
+        warm_up.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await warm_up
+        logger.info("Shutting down, closing elastic clients")
+        # Clients retired by reload_accounts, cancelling makes them close without waiting for idle
+        closing = list(state["closing"])
+        for task in closing:
+            task.cancel()
+        await asyncio.gather(*closing, return_exceptions=True)
+        # reload_accounts may have replaced the dict, close whatever is current
+        for client in state["clients"].values():
+            await client.close()
+
+
 # Initialize FastMCP server
-mcp = FastMCP(name="elastic-cloud-billing")
+mcp = FastMCP(name="elastic-cloud-billing", lifespan=lifespan)
 
 
-# Initialize billing tools
-try:
-    logger.info("Initializing Elastic Billing MCP Server...")
-    elastic_client = ElasticCloudClient(settings.default_account)
-    logger.info("MCP Server initialized successfully")
-except Exception as e:
-    logger.exception(f"Failed to initialize elastic client: {e!s}")
-    raise
+def get_elastic_client(account: str | None = None) -> ElasticCloudClient:
+    """Get the shared elastic client for an account (defaults to the active one), creating it on first use."""
+    state = get_context().request_context.lifespan_context
+    account = account or state["active_account"]
+    clients = state["clients"]
+    if account not in clients:
+        clients[account] = ElasticCloudClient(account)
+    return clients[account]
 
 
 # decorators to be used with tools
@@ -48,14 +120,15 @@ def auto_doc_mcp_tool():
 async def get_deployments() -> dict:
     """Get the list of deployments."""
     try:
+        elastic_client = get_elastic_client()
         logger.info("Getting list of deployments")
         result = await elastic_client.get_deployments()
         logger.info(
-            f"Successfully retrieved {len(result.get('deployments', []))} deployments"
+            "Successfully retrieved %s deployments", len(result.get("deployments", []))
         )
         return result
     except Exception as e:
-        logger.error(f"Failed to get list of deployments: {e!s}")
+        logger.error("Failed to get list of deployments: %s", e)
         return {
             "error": f"Failed to get list of deployments: {e!s}",
         }
@@ -65,12 +138,13 @@ async def get_deployments() -> dict:
 async def get_deployment(deployment_id: str) -> dict:
     """Get a specific deployment."""
     try:
-        logger.info(f"Getting deployment {deployment_id}")
+        elastic_client = get_elastic_client()
+        logger.info("Getting deployment %s", deployment_id)
         result = await elastic_client.get_deployment(deployment_id)
-        logger.info(f"Successfully retrieved deployment {deployment_id}")
+        logger.info("Successfully retrieved deployment %s", deployment_id)
         return result
     except Exception as e:
-        logger.error(f"Failed to get deployment: {e!s}")
+        logger.error("Failed to get deployment: %s", e)
         return {
             "error": f"Failed to get deployment: {e!s}",
             "deployment_id": deployment_id,
@@ -79,15 +153,17 @@ async def get_deployment(deployment_id: str) -> dict:
 
 @auto_doc_mcp_tool()
 async def get_items_costs(start_date: datetime, end_date: datetime, organization_id: str) -> dict:
-    """Get costs broken down by environment/deployment."""
+    """Get costs broken down by environment/deployment.
+    Dates are converted to UTC and truncated to the minute."""
     try:
+        elastic_client = get_elastic_client()
         logger.info(
-            f"Getting items costs for date range from {start_date} to {end_date}"
+            "Getting items costs for date range from %s to %s", start_date, end_date
         )
         result = await elastic_client.get_items_costs(start_date, end_date, organization_id)
         return result
     except Exception as e:
-        logger.error(f"Failed to get items costs: {e!s}")
+        logger.error("Failed to get items costs: %s", e)
         return {
             "error": f"Failed to get items costs: {e!s}",
             "start_date": start_date,
@@ -99,6 +175,7 @@ async def get_items_costs(start_date: datetime, end_date: datetime, organization
 @auto_doc_mcp_tool()
 async def get_instances_costs(start_date: datetime, end_date: datetime, organization_id: str) -> dict:
     """Get costs associated with all instances for date range.
+    Dates are converted to UTC and truncated to the minute.
 
         Args:
         start_date: The start date of the time period if this is more than 4 months from end date the api will fail,
@@ -113,13 +190,14 @@ async def get_instances_costs(start_date: datetime, end_date: datetime, organiza
             In cases the user needs more than that you need to split the period to chunks of 4 months.
     """
     try:
+        elastic_client = get_elastic_client()
         logger.info(
-            f"Getting instances costs for date range from {start_date} to {end_date}"
+            "Getting instances costs for date range from %s to %s", start_date, end_date
         )
         result = await elastic_client.get_instances_costs(start_date, end_date, organization_id)
         return result
     except Exception as e:
-        logger.error(f"Failed to get instances costs: {e!s}")
+        logger.error("Failed to get instances costs: %s", e)
         return {
             "error": f"Failed to get instances costs: {e!s}",
             "start_date": start_date,
@@ -134,10 +212,11 @@ async def get_instance_costs(
     start_date: datetime, end_date: datetime, instance_id: str, organization_id: str
 ) -> dict:
     """Get costs associated to a set of items billed for a single instance for date range.
+    Dates are converted to UTC and truncated to the minute.
     Suggested Usage:
         To get the full cost for an instance over a period longer than 12 months, 
-        split the period into multiple 12-month segments and call this tool for each segment separately. 
-        If this fails, split in monthly segments.
+        use the get_instance_costs_long_range tool instead.
+        If this fails, split the period into monthly segments and call this tool for each segment separately.
 
     Limitations:
             The period that api works for is up to 15 months.
@@ -153,16 +232,50 @@ async def get_instance_costs(
         organization_id: The id of the organization the instance belongs to. (use account id if this is not provided by the user)
     """
     try:
+        elastic_client = get_elastic_client()
         logger.info(
-            f"Getting instance costs for date range from {start_date} to {end_date} for instance {instance_id}"
+            "Getting instance costs for date range from %s to %s for instance %s", start_date, end_date, instance_id
         )
         result = await elastic_client.get_instance_costs(
             start_date, end_date, organization_id, instance_id
         )
-        # logger.info(f"Instance costs: {result}")
+        # logger.info("Instance costs: %s", result)
         return result
     except Exception as e:
-        logger.error(f"Failed to get instance costs: {e!s}")
+        logger.error("Failed to get instance costs: %s", e)
+        return {
+            "error": f"Failed to get instance costs: {e!s}",
+            "start_date": start_date,
+            "end_date": end_date,
+            "instance_id": instance_id,
+        }
+
+
+@auto_doc_mcp_tool()
+async def get_instance_costs_long_range(
+    start_date: datetime, end_date: datetime, instance_id: str, organization_id: str
+) -> dict:
+    """Get costs associated to a set of items billed for a single instance over a period of any length.
+    The period is split into 12-month segments that are fetched concurrently and merged
+    (costs are summed, items of the same type are combined, fields that differ between segments are dropped).
+    Dates are converted to UTC and truncated to the minute.
+
+    Args:
+        start_date: The start date of the time period.
+        end_date: The end date of the time period.
+        instance_id: The id of the instance or environment can be found from the get_deployments tool and is the cluster id.
+        organization_id: The id of the organization the instance belongs to. (use account id if this is not provided by the user)
+    """
+    try:
+        elastic_client = get_elastic_client()
+        logger.info(
+            "Getting instance costs for date range from %s to %s for instance %s in segments", start_date, end_date, instance_id
+        )
+        return await elastic_client.get_instance_costs_range(
+            start_date, end_date, organization_id, instance_id
+        )
+    except Exception as e:
+        logger.error("Failed to get instance costs: %s", e)
         return {
             "error": f"Failed to get instance costs: {e!s}",
             "start_date": start_date,
@@ -176,7 +289,14 @@ async def get_environment_cost(
     start_date: datetime, end_date: datetime, instance_id: str, organization_id: str
 ) -> dict:
     """Total cost of an environment/instance for a given time period (only returns total_ecu to reduce context size)"""
-    result = await elastic_client.get_instance_costs(start_date, end_date, instance_id, organization_id)
+    try:
+        elastic_client = get_elastic_client()
+        result = await elastic_client.get_instance_costs(start_date, end_date, instance_id, organization_id)
+    except Exception as e:
+        logger.error("Failed to get environment cost: %s", e)
+        return {
+            "error": f"Failed to get environment cost: {e!s}",
+        }
     if result.get("total_ecu"):
         return {
             "total_ecu": result.get("total_ecu"),
@@ -190,8 +310,9 @@ async def get_environment_cost(
 async def switch_account(account: str) -> dict:
     """Switch between Elastic Cloud accounts (dev, preprod, default)."""
     try:
-        logger.info(f"Switching to account: {account}")
-        elastic_client.switch_account(account)
+        logger.info("Switching to account: %s", account)
+        elastic_client = get_elastic_client(account)
+        get_context().request_context.lifespan_context["active_account"] = account
         return {
             "success": True,
             "account": account,
@@ -199,7 +320,7 @@ async def switch_account(account: str) -> dict:
             "message": f"Switched to {account} account",
         }
     except Exception as e:
-        logger.error(f"Failed to switch account: {e!s}")
+        logger.error("Failed to switch account: %s", e)
         return {
             "success": False,
             "error": f"Failed to switch account: {e!s}",
@@ -210,6 +331,13 @@ async def switch_account(account: str) -> dict:
 @auto_doc_mcp_tool()
 async def get_current_account() -> dict:
     """Get current active account information."""
+    try:
+        elastic_client = get_elastic_client()
+    except Exception as e:
+        logger.error("Failed to get current account: %s", e)
+        return {
+            "error": f"Failed to get current account: {e!s}",
+        }
     return {
         "account": elastic_client.account,
         "org_id": elastic_client.org_id,
@@ -225,18 +353,42 @@ async def list_accounts() -> dict:
     return available_accounts()
 
 
+@auto_doc_mcp_tool()
+async def reload_accounts() -> dict:
+    """Rescan the configured accounts directory, use after adding, removing or editing account .env files."""
+    state = get_context().request_context.lifespan_context
+    result = reload_account_files()
+    if state["active_account"] not in result.get("accounts", []):
+        logger.warning(
+            "Active account %s no longer exists, falling back to %s",
+            state["active_account"],
+            settings.default_account,
+        )
+        state["active_account"] = settings.default_account
+
+    # Swap in an empty dict so clients are recreated with the reloaded credentials on next use,
+    # old clients are closed in the background once the requests already running on them finish
+    old_clients, state["clients"] = state["clients"], {}
+    for client in old_clients.values():
+        task = asyncio.create_task(close_when_idle(client))
+        state["closing"].add(task)
+        task.add_done_callback(state["closing"].discard)
+    return result
+
+
 @auto_doc_mcp_tool()
 async def get_organizations() -> dict:
     """Get the list of organizations the active apikey can get info from."""
     try:
+        elastic_client = get_elastic_client()
         logger.info("Getting list of organizations")
         result = await elastic_client.get_organizations()
         logger.info(
-            f"Successfully retrieved {len(result.get('organizations', []))} organizations"
+            "Successfully retrieved %s organizations", len(result.get("organizations", []))
         )
         return result
     except Exception as e:
-        logger.error(f"Failed to get list of organizations: {e!s}")
+        logger.error("Failed to get list of organizations: %s", e)
         return {
             "error": f"Failed to get list of organizations: {e!s}",
         }
@@ -246,14 +398,15 @@ async def get_organizations() -> dict:
 async def get_organization_members(org_id: str | None = None) -> dict:
     """Get members of the specified organization. If no org_id is provided, use the current org_id."""
     try:
-        logger.info(f"Getting members for organization {org_id or elastic_client.org_id}")
+        elastic_client = get_elastic_client()
+        logger.info("Getting members for organization %s", org_id or elastic_client.org_id)
         result = await elastic_client.get_organization_members(org_id)
         logger.info(
-            f"Successfully retrieved {len(result.get('members', []))} members for organization {org_id or elastic_client.org_id}"
+            "Successfully retrieved %s members for organization %s", len(result.get("members", [])), org_id or elastic_client.org_id
         )
         return result
     except Exception as e:
-        logger.error(f"Failed to get organization members: {e!s}")
+        logger.error("Failed to get organization members: %s", e)
         return {
             "error": f"Failed to get organization members: {e!s}",
             "org_id": org_id,
@@ -264,12 +417,13 @@ async def get_account_info() -> dict:
     """Get account information for the current API key.
     Can be used to verify which account the key belongs to (is also the base org_id for the account)."""
     try:
+        elastic_client = get_elastic_client()
         logger.info("Getting account information")
         result = await elastic_client.get_account_info()
-        logger.info(f"Successfully retrieved account information")
+        logger.info("Successfully retrieved account information")
         return result
     except Exception as e:
-        logger.error(f"Failed to get account information: {e!s}")
+        logger.error("Failed to get account information: %s", e)
         return {
             "error": f"Failed to get account information: {e!s}",
         }